@@ -1,4 +1,21 @@
+import argparse
+import bisect
+import hashlib
+import json
+import os
 import subprocess
+import sys
+import time
+
+# Account details are cached on disk so re-running the helper skips the slow az startup
+ACCOUNT_CACHE_PATH = os.environ.get(
+    "AZ_ACCOUNT_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "azure-iac-project", "account.json"))
+ACCOUNT_CACHE_TTL = int(os.environ.get("AZ_ACCOUNT_CACHE_TTL", "3600"))
+
+STORAGE_ACCOUNT_PREFIX = "tfstate"
+
+_account_info = None
+_storage_index = None
 
 
 def run_az_command(command):
@@ -10,14 +27,84 @@ def run_az_command(command):
     return result.stdout.decode('utf-8').strip()
 
 
+def get_login_signature():
+    """Fingerprint the Azure CLI profile so a new login or subscription switch invalidates the cache."""
+    config_dir = os.environ.get("AZURE_CONFIG_DIR", os.path.join(os.path.expanduser("~"), ".azure"))
+    try:
+        with open(os.path.join(config_dir, "azureProfile.json"), "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def load_cached_account(signature):
+    """Return the cached account document if it is fresh and belongs to the current login."""
+    try:
+        with open(ACCOUNT_CACHE_PATH) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("signature") != signature:
+        return None
+    if time.time() - cached.get("fetched_at", 0) > ACCOUNT_CACHE_TTL:
+        return None
+    return cached.get("account")
+
+
+def save_cached_account(account, signature):
+    """Write the account document to the cache file, readable only by the current user."""
+    os.makedirs(os.path.dirname(ACCOUNT_CACHE_PATH), exist_ok=True)
+    tmp_path = f"{ACCOUNT_CACHE_PATH}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump({"signature": signature, "fetched_at": time.time(), "account": account}, f)
+    os.replace(tmp_path, ACCOUNT_CACHE_PATH)
+
+
+def get_account_info(refresh=False):
+    """Retrieve subscription, tenant and user with a single az call, cached in memory and on disk."""
+    global _account_info
+    if _account_info is not None and not refresh:
+        return _account_info
+
+    signature = get_login_signature()
+    account = None if refresh or ACCOUNT_CACHE_TTL <= 0 else load_cached_account(signature)
+    if account is None:
+        output = run_az_command('az account show -o json')
+        if not output:
+            return None
+        document = json.loads(output)
+        account = {
+            "id": document.get("id"),
+            "name": document.get("name"),
+            "tenantId": document.get("tenantId"),
+            "user": (document.get("user") or {}).get("name")
+        }
+        if ACCOUNT_CACHE_TTL > 0:
+            try:
+                save_cached_account(account, signature)
+            except OSError as e:
+                print(f"Could not write account cache {ACCOUNT_CACHE_PATH}: {e}")
+    _account_info = account
+    return account
+
+
 def get_subscription_id():
     """Retrieve the Azure subscription ID."""
-    return run_az_command('az account show --query id -o tsv')
+    account = get_account_info()
+    return account["id"] if account else None
 
 
 def get_tenant_id():
     """Retrieve the Azure AD tenant ID."""
-    return run_az_command('az account show --query tenantId -o tsv')
+    account = get_account_info()
+    return account["tenantId"] if account else None
+
+
+def get_signed_in_user():
+    """Retrieve the signed-in user or service principal name."""
+    account = get_account_info()
+    return account["user"] if account else None
 
 
 def get_resource_groups():
@@ -29,17 +116,63 @@ def get_resource_groups():
     return output.split('\n')
 
 
-def get_storage_accounts(resource_group=None):
-    """Retrieve storage accounts within a resource group or the subscription."""
+def get_storage_account_index(refresh=False):
+    """Fetch every storage account in the subscription once and index it by resource group, name and tags."""
+    global _storage_index
+    if _storage_index is not None and not refresh:
+        return _storage_index
+
+    output = run_az_command(
+        'az storage account list '
+        '--query "[].{name:name, resourceGroup:resourceGroup, location:location, tags:tags}" -o json')
+    accounts = json.loads(output) if output else []
+    index = {"accounts": accounts, "by_group": {}, "by_tag": {}, "names": [], "by_name": {}}
+    for account in accounts:
+        index["by_group"].setdefault(account["resourceGroup"].lower(), []).append(account)
+        index["by_name"][account["name"]] = account
+        for key, value in (account.get("tags") or {}).items():
+            index["by_tag"].setdefault((key.lower(), None), []).append(account)
+            index["by_tag"].setdefault((key.lower(), value), []).append(account)
+    # Sorted names answer prefix lookups with a binary search
+    index["names"] = sorted(index["by_name"])
+    _storage_index = index
+    return index
+
+
+def find_storage_accounts(resource_group=None, prefix=None, tags=None):
+    """Look up storage accounts in the index by resource group, name prefix and tags (None matches any value)."""
+    index = get_storage_account_index()
     if resource_group:
-        command = f'az storage account list --resource-group {resource_group} --query "[].name" -o tsv'
+        matches = index["by_group"].get(resource_group.lower(), [])
     else:
-        command = 'az storage account list --query "[].name" -o tsv'
-    output = run_az_command(command)
-    if not output:
+        matches = index["accounts"]
+    if prefix:
+        names = index["names"]
+        start = bisect.bisect_left(names, prefix)
+        end = bisect.bisect_left(names, prefix + "\uffff", start)
+        prefixed = {name for name in names[start:end]}
+        matches = [a for a in matches if a["name"] in prefixed]
+    for key, value in (tags or {}).items():
+        tagged = {a["name"] for a in index["by_tag"].get((key.lower(), value), [])}
+        matches = [a for a in matches if a["name"] in tagged]
+    return matches
+
+
+def find_state_storage_accounts():
+    """Storage accounts that look like Terraform state stores, by name prefix or Purpose tag."""
+    matches = {a["name"]: a for a in find_storage_accounts(prefix=STORAGE_ACCOUNT_PREFIX)}
+    for account in find_storage_accounts(tags={"Purpose": "terraform-state"}):
+        matches.setdefault(account["name"], account)
+    return sorted(matches.values(), key=lambda a: a["name"])
+
+
+def get_storage_accounts(resource_group=None):
+    """Retrieve storage accounts within a resource group or the subscription."""
+    accounts = find_storage_accounts(resource_group=resource_group)
+    if not accounts:
         print("No storage accounts found. Please ensure you have permissions and storage accounts in your subscription.")
         return []
-    return output.split('\n')
+    return [account["name"] for account in accounts]
 
 
 def get_storage_account_name(resource_group):
@@ -59,50 +192,154 @@ def get_storage_account_name(resource_group):
 def get_storage_account_prefix():
     """Retrieve the storage account prefix."""
     print("Retrieving storage account prefix...")
-    return "tfstate"
+    return STORAGE_ACCOUNT_PREFIX
 
 
-def get_state_file_key():
+def get_state_file_key(environment="dev"):
     """Retrieve the key for the state file within the container."""
-    return "dev"  # Hard-coded value for the state file key
-
-
-# Main Logic
-print("Azure Terraform Project Setup Helper\n")
-
-subscription_id = get_subscription_id()
-if subscription_id:
-    print(f"Your Azure subscription ID is: {subscription_id}\n")
-else:
-    print("Failed to retrieve subscription ID. Please ensure Azure CLI is authenticated.")
-
-tenant_id = get_tenant_id()
-if tenant_id:
-    print(f"Your Azure AD tenant ID is: {tenant_id}\n")
-else:
-    print("Failed to retrieve tenant ID. Please ensure Azure CLI is authenticated.")
-
-print("Available resource groups:")
-resource_groups = get_resource_groups()
-if resource_groups:
-    for i, rg in enumerate(resource_groups, start=1):
-        print(f"{i}. {rg}")
-    resource_group_index = int(input("Please enter the number of the resource group you want to use: "))
-    resource_group = resource_groups[resource_group_index - 1]
-else:
-    resource_group = input("Please enter the name of the resource group manually: ")
-
-storage_account_name = get_storage_account_name(resource_group)
-if not storage_account_name:
-    storage_account_name = input("No storage account found. Please enter the storage account name manually: ")
-
-storage_account_prefix = get_storage_account_prefix()
-state_file_key = get_state_file_key()
-
-print("\nSummary of retrieved information:\n")
-print(f"Subscription ID: {subscription_id}")
-print(f"Tenant ID: {tenant_id}")
-print(f"Resource Group: {resource_group}")
-print(f"Storage Account Name: {storage_account_name}")
-print(f"Storage Account Prefix: {storage_account_prefix}")
-print(f"Path to State File (Key): {state_file_key}")
\ No newline at end of file
+    return f"{environment}.terraform.tfstate"
+
+
+def discover_environments(environments_dir):
+    """List the environment directories (dev, staging, prod, ...) under environments/."""
+    if not os.path.isdir(environments_dir):
+        return []
+    return sorted(d for d in os.listdir(environments_dir)
+                  if os.path.isdir(os.path.join(environments_dir, d)))
+
+
+def render_backend_config(settings, fmt):
+    """Render backend settings as a backend.tf block or a -backend-config file."""
+    width = max(len(key) for key in settings)
+    lines = [f'{key.ljust(width)} = "{value}"' for key, value in settings.items()]
+    if fmt == "hcl":
+        return "\n".join(lines) + "\n"
+    body = "\n".join(f"    {line}" for line in lines)
+    return f'terraform {{\n  backend "azurerm" {{\n{body}\n  }}\n}}\n'
+
+
+def generate_backend_configs(environments_dir, storage_account=None, container="tfstate",
+                             fmt="hcl", dry_run=False):
+    """Write backend configuration for every environment in one pass, without prompts."""
+    environments = discover_environments(environments_dir)
+    if not environments:
+        print(f"No environments found under {environments_dir}")
+        return False
+
+    if storage_account:
+        account = get_storage_account_index()["by_name"].get(storage_account)
+        if not account:
+            print(f"Storage account {storage_account} not found in the current subscription.")
+            return False
+    else:
+        candidates = find_state_storage_accounts()
+        if len(candidates) != 1:
+            names = ", ".join(a["name"] for a in candidates) or "none"
+            print(f"Expected exactly one state storage account, found: {names}. "
+                  f"Pass --storage-account to choose one.")
+            return False
+        account = candidates[0]
+
+    subscription_id = get_subscription_id()
+    file_name = "backend.hcl" if fmt == "hcl" else "backend.tf"
+    print(f"Using storage account {account['name']} in resource group {account['resourceGroup']}")
+    for environment in environments:
+        settings = {
+            "resource_group_name": account["resourceGroup"],
+            "storage_account_name": account["name"],
+            "container_name": container,
+            "key": get_state_file_key(environment)
+        }
+        if subscription_id:
+            settings["subscription_id"] = subscription_id
+        content = render_backend_config(settings, fmt)
+        path = os.path.join(environments_dir, environment, file_name)
+        if dry_run:
+            print(f"\n# {path}\n{content}", end="")
+            continue
+        try:
+            with open(path) as f:
+                unchanged = f.read() == content
+        except OSError:
+            unchanged = False
+        if unchanged:
+            print(f"{path}: up to date")
+            continue
+        with open(path, "w") as f:
+            f.write(content)
+        print(f"{path}: written")
+    return True
+
+
+def interactive_setup():
+    """Prompt for the resource group and storage account and summarize the backend settings."""
+    print("Azure Terraform Project Setup Helper\n")
+
+    subscription_id = get_subscription_id()
+    if subscription_id:
+        print(f"Your Azure subscription ID is: {subscription_id}\n")
+    else:
+        print("Failed to retrieve subscription ID. Please ensure Azure CLI is authenticated.")
+
+    tenant_id = get_tenant_id()
+    if tenant_id:
+        print(f"Your Azure AD tenant ID is: {tenant_id}\n")
+    else:
+        print("Failed to retrieve tenant ID. Please ensure Azure CLI is authenticated.")
+
+    print("Available resource groups:")
+    resource_groups = get_resource_groups()
+    if resource_groups:
+        for i, rg in enumerate(resource_groups, start=1):
+            print(f"{i}. {rg}")
+        resource_group_index = int(input("Please enter the number of the resource group you want to use: "))
+        resource_group = resource_groups[resource_group_index - 1]
+    else:
+        resource_group = input("Please enter the name of the resource group manually: ")
+
+    storage_account_name = get_storage_account_name(resource_group)
+    if not storage_account_name:
+        storage_account_name = input("No storage account found. Please enter the storage account name manually: ")
+
+    storage_account_prefix = get_storage_account_prefix()
+    state_file_key = get_state_file_key()
+
+    print("\nSummary of retrieved information:\n")
+    print(f"Subscription ID: {subscription_id}")
+    print(f"Tenant ID: {tenant_id}")
+    print(f"Signed-in User: {get_signed_in_user()}")
+    print(f"Resource Group: {resource_group}")
+    print(f"Storage Account Name: {storage_account_name}")
+    print(f"Storage Account Prefix: {storage_account_prefix}")
+    print(f"Path to State File (Key): {state_file_key}")
+
+
+def main():
+    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser = argparse.ArgumentParser(description="Azure Terraform Project Setup Helper")
+    parser.add_argument("--batch", action="store_true",
+                        help="Generate backend configuration for every environment without prompts.")
+    parser.add_argument("--environments-dir", default=os.path.join(repo_root, "environments"),
+                        help="Directory containing one folder per environment (default: %(default)s).")
+    parser.add_argument("--storage-account",
+                        help="State storage account to use instead of discovering it by prefix or tag.")
+    parser.add_argument("--container", default="tfstate", help="Blob container for state files (default: tfstate).")
+    parser.add_argument("--format", choices=["hcl", "tf"], default="hcl",
+                        help="hcl writes backend.hcl for 'terraform init -backend-config=backend.hcl'; "
+                             "tf rewrites backend.tf (default: hcl).")
+    parser.add_argument("--dry-run", action="store_true", help="Print the generated files instead of writing them.")
+    parser.add_argument("--refresh", action="store_true", help="Ignore the cached account details.")
+    args = parser.parse_args()
+
+    if args.refresh:
+        get_account_info(refresh=True)
+
+    if args.batch:
+        ok = generate_backend_configs(args.environments_dir, args.storage_account, args.container,
+                                      args.format, args.dry_run)
+        sys.exit(0 if ok else 1)
+    interactive_setup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+"""
+Commit: Offline Orchestrator Benchmarks
+Runs InfrastructureTestRunner against stub terraform and az binaries in a
+generated tree of modules and environments, so runner regressions can be
+measured without Azure, providers or network access.
+
+Usage:
+  python tests/benchmarks/orchestrator_bench.py --modules 4,16 --environments 3,6
+  python tests/benchmarks/orchestrator_bench.py --suites modules --jobs 4 --json bench.json
+  python tests/benchmarks/orchestrator_bench.py --suites backend --fake-az --az-error-rate 0.1
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+TESTS_DIR = os.path.dirname(BENCH_DIR)
+REPO_ROOT = os.path.dirname(TESTS_DIR)
+STUBS_DIR = os.path.join(BENCH_DIR, "stubs")
+FAKES_DIR = os.path.join(TESTS_DIR, "fakes")
+
+SUITES = ["modules", "backend", "all-env"]
+
+MODULE_FILES = {
+    "main.tf": 'resource "azurerm_resource_group" "bench" {\n  name     = var.name\n  location = "eastus"\n}\n',
+    "variables.tf": 'variable "name" {\n  type    = string\n  default = "bench"\n}\n',
+    "outputs.tf": 'output "id" {\n  value = azurerm_resource_group.bench.id\n}\n'
+}
+
+
+def build_tree(root: str, modules: int, environments: int):
+    """Create a synthetic repository layout with the given number of directories"""
+    lock_file = os.path.join(REPO_ROOT, "modules", "networking", ".terraform.lock.hcl")
+    for index in range(modules):
+        module_dir = os.path.join(root, "modules", f"module{index:03d}")
+        os.makedirs(module_dir)
+        for name, content in MODULE_FILES.items():
+            with open(os.path.join(module_dir, name), "w") as f:
+                f.write(content)
+        if os.path.exists(lock_file):
+            shutil.copy(lock_file, module_dir)
+
+    for index in range(environments):
+        env_dir = os.path.join(root, "environments", f"env{index:03d}")
+        os.makedirs(env_dir)
+        with open(os.path.join(env_dir, "main.tf"), "w") as f:
+            f.write('module "bench" {\n  source = "../../modules/module000"\n}\n')
+        with open(os.path.join(env_dir, "variables.tf"), "w") as f:
+            f.write('variable "environment" {\n  type = string\n}\n')
+
+    backend_dir = os.path.join(root, "backend-config")
+    os.makedirs(backend_dir)
+    with open(os.path.join(backend_dir, "main.tf"), "w") as f:
+        f.write(MODULE_FILES["main.tf"])
+
+
+def busy_time(intervals: List[Tuple[int, int]]) -> float:
+    """Seconds during which at least one subprocess was running"""
+    total = 0
+    current_start, current_end = None, None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total / 1e9
+
+
+def run_case(suite: str, modules: int, environments: int, jobs: int,
+             latency: float, output_bytes: int, fake_az: bool = False,
+             az_error_rate: float = 0.0) -> Dict:
+    """Run one benchmark case in this process and return its measurements"""
+    workdir = tempfile.mkdtemp(prefix="orchestrator-bench-")
+    try:
+        build_tree(workdir, modules, environments)
+        path = [STUBS_DIR, os.environ.get("PATH", "")]
+        if fake_az:
+            # The fixture-driven fake az shadows the stub one
+            path.insert(0, FAKES_DIR)
+            os.environ["FAKE_AZ_STATE"] = os.path.join(workdir, ".fake-az-state.json")
+            os.environ["FAKE_AZ_LATENCY"] = str(latency)
+            os.environ["FAKE_AZ_ERROR_RATE"] = str(az_error_rate)
+            os.environ.setdefault("FAKE_AZ_SEED", "0")
+        os.environ["PATH"] = os.pathsep.join(path)
+        os.environ["STUB_LATENCY"] = str(latency)
+        os.environ["STUB_OUTPUT_BYTES"] = str(output_bytes)
+        os.environ["TF_TEST_PLUGIN_CACHE_ROOT"] = os.path.join(workdir, ".plugin-cache")
+        # Stub durations must not feed the adaptive timeouts of real runs
+        os.environ["TF_TEST_DURATIONS_PATH"] = os.path.join(workdir, ".command-durations.json")
+        os.chdir(workdir)
+
+        sys.path.insert(0, TESTS_DIR)
+        import logging
+        import infrastructure_test as framework
+        logging.getLogger().setLevel(logging.WARNING)
+
+        runner = framework.InfrastructureTestRunner(jobs=jobs)
+        suite_methods = {
+            "modules": runner.test_core_modules,
+            "backend": runner.test_backend_config,
+            "all-env": runner.test_environment_configs
+        }
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            suite_methods[suite]()
+            wall = time.perf_counter() - start
+
+        spans = [span for span in framework.TRACER._spans if span.category == "subprocess"]
+        commands = len(spans)
+        busy = busy_time([(span.start_ns, span.end_ns) for span in spans])
+        mean_command = sum(span.elapsed for span in spans) / commands if commands else 0.0
+
+        return {
+            "suite": suite,
+            "modules": modules,
+            "environments": environments,
+            "jobs": jobs,
+            "latency_s": latency,
+            "output_bytes": output_bytes,
+            "results": len(runner.test_results),
+            "failed": sum(1 for r in runner.test_results if not r.status),
+            "commands": commands,
+            "wall_s": round(wall, 4),
+            "throughput_cmd_s": round(commands / wall, 2) if wall else 0.0,
+            # Time where the runner was doing its own work with no subprocess running
+            "overhead_s": round(wall - busy, 4),
+            "overhead_pct": round(100 * (wall - busy) / wall, 2) if wall else 0.0,
+            # Spawn, capture and scheduling cost on top of the stub's sleep
+            "per_command_overhead_ms": round(1000 * (mean_command - latency), 2),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "children_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+        }
+    finally:
+        os.chdir(REPO_ROOT)
+        framework = sys.modules.get("infrastructure_test")
+        if framework is not None:
+            # Flush now so the exit handler has nothing left to write
+            framework.CommandRunner.policy.save()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_isolated(suite: str, modules: int, environments: int, jobs: int,
+                 latency: float, output_bytes: int, fake_az: bool = False,
+                 az_error_rate: float = 0.0) -> Dict:
+    """Run a case in a fresh interpreter so peak RSS is measured per case"""
+    command = [
+        sys.executable, os.path.abspath(__file__), "--run-case",
+        "--suites", suite, "--modules", str(modules), "--environments", str(environments),
+        "--jobs", str(jobs), "--latency", str(latency), "--output-bytes", str(output_bytes),
+        "--az-error-rate", str(az_error_rate)
+    ]
+    if fake_az:
+        command.append("--fake-az")
+    process = subprocess.run(command, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Benchmark case failed: {process.stderr}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def parse_counts(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def print_table(rows: List[Dict]):
+    columns = ["suite", "modules", "environments", "jobs", "commands", "wall_s",
+               "throughput_cmd_s", "overhead_s", "overhead_pct",
+               "per_command_overhead_ms", "peak_rss_mb"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the infrastructure test orchestrator")
+    parser.add_argument("--suites", default=",".join(SUITES),
+                        help=f"Comma separated suites to run ({', '.join(SUITES)})")
+    parser.add_argument("--modules", default="4,16", help="Comma separated module counts")
+    parser.add_argument("--environments", default="3,9", help="Comma separated environment counts")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker count passed to the runner")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub command latency in seconds")
+    parser.add_argument("--output-bytes", type=int, default=4096, help="Stub stdout size per command")
+    parser.add_argument("--fake-az", action="store_true",
+                        help="Answer az calls with the fixture-driven fake in tests/fakes")
+    parser.add_argument("--az-error-rate", type=float, default=0.0,
+                        help="Fraction of fake az calls that fail with a throttling error")
+    parser.add_argument("--json", metavar="FILE", help="Also write the measurements to FILE")
+    parser.add_argument("--run-case", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    suites = [s for s in args.suites.split(",") if s]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"Unknown suites: {', '.join(sorted(unknown))}")
+
+    if args.run_case:
+        row = run_case(suites[0], parse_counts(args.modules)[0], parse_counts(args.environments)[0],
+                       args.jobs, args.latency, args.output_bytes, args.fake_az, args.az_error_rate)
+        print(json.dumps(row))
+        return
+
+    rows = []
+    for suite in suites:
+        for modules in parse_counts(args.modules):
+            for environments in parse_counts(args.environments):
+                rows.append(run_isolated(suite, modules, environments, args.jobs,
+                                         args.latency, args.output_bytes,
+                                         args.fake_az, args.az_error_rate))
+
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nBenchmark results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1249 @@
+#!/usr/bin/env python3
+
+"""
+Commit: Runner Unit Tests
+Behaviour tests for the in-process parts of the test runner. terraform and
+az are replaced by small in-process fakes, so no binaries are needed.
+
+Usage:
+  python -m pytest -q tests/runner_unit_test.py
+"""
+
+import datetime
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import infrastructure_test as framework
+
+
+def write_files(directory, files):
+    for name, content in files.items():
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+
+@pytest.fixture
+def prevalidate(tmp_path):
+    """Write .tf files into a fresh module directory and return its problems"""
+    def check(files, directory="module"):
+        module_dir = tmp_path / directory
+        write_files(str(module_dir), files)
+        return framework.HclPrevalidator().check(str(module_dir))
+    return check
+
+
+@pytest.fixture
+def spill_dir(tmp_path, monkeypatch):
+    """Send BoundedOutput spill files to a temporary directory"""
+    directory = tmp_path / "output"
+    monkeypatch.setattr(framework.BoundedOutput, "SPILL_DIR", str(directory))
+    monkeypatch.setattr(framework.BoundedOutput, "_pruned", True)
+    return directory
+
+
+@pytest.fixture
+def fail_fast():
+    yield framework.FAIL_FAST
+    framework.FAIL_FAST.enabled = False
+    framework.FAIL_FAST.reset()
+
+
+class TestHclScan:
+    """Syntax errors found by HclPrevalidator.scan"""
+
+    def test_unterminated_string(self):
+        _, errors = framework.HclPrevalidator().scan('locals {\n  name = "abc\n}\n')
+        assert (2, "unterminated string") in errors
+
+    def test_unterminated_heredoc(self):
+        _, errors = framework.HclPrevalidator().scan('locals {\n  text = <<EOT\nhello\n}\n')
+        assert errors == [(2, "unterminated heredoc EOT")]
+
+    def test_indented_heredoc_closes(self):
+        _, errors = framework.HclPrevalidator().scan('locals {\n  text = <<-EOT\n    {[(\n  EOT\n}\n')
+        assert errors == []
+
+    def test_unterminated_block_comment(self):
+        _, errors = framework.HclPrevalidator().scan('/* never closed\nvariable "a" {}\n')
+        assert errors == [(1, "unterminated block comment")]
+
+    def test_mismatched_bracket(self):
+        _, errors = framework.HclPrevalidator().scan('locals {\n  list = [1, 2)\n}\n')
+        assert errors == [(2, "unexpected ')', expected ']' to close '[' from line 2")]
+
+    def test_brackets_inside_strings_and_comments_are_ignored(self):
+        _, errors = framework.HclPrevalidator().scan(
+            'locals {\n  a = "}{]["  # )\n  // (\n  b = /* [ */ 1\n}\n')
+        assert errors == []
+
+    def test_code_keeps_its_length(self):
+        text = 'locals {\n  a = "x ${var.y} z" # note\n}\n'
+        code, _ = framework.HclPrevalidator().scan(text)
+        assert len(code) == len(text)
+        assert "var.y" in code and "note" not in code
+
+
+class TestHclPrevalidator:
+    """Directory-level checks of HclPrevalidator.check"""
+
+    def test_clean_module(self, prevalidate):
+        assert prevalidate({
+            "variables.tf": 'variable "name" {\n  type = string\n}\n',
+            "main.tf": 'resource "azurerm_resource_group" "main" {\n  name = var.name\n}\n',
+            "outputs.tf": 'output "id" {\n  value = azurerm_resource_group.main.id\n}\n'
+        }) == []
+
+    def test_undeclared_variable(self, prevalidate):
+        problems = prevalidate({"main.tf": 'locals {\n  a = var.missing\n}\n'})
+        assert len(problems) == 1
+        assert problems[0].endswith('main.tf:2: reference to undeclared variable "missing"')
+
+    def test_interpolation_in_string_is_checked(self, prevalidate):
+        problems = prevalidate({"main.tf": 'locals {\n  a = "pre-${var.missing}"\n}\n'})
+        assert [p.split(": ", 1)[1] for p in problems] == ['reference to undeclared variable "missing"']
+
+    def test_escaped_interpolation_is_literal(self, prevalidate):
+        assert prevalidate({
+            "main.tf": 'locals {\n  a = "$${var.literal}"\n  b = "%%{if true}"\n}\n'
+        }) == []
+
+    def test_escaped_interpolation_in_heredoc_is_literal(self, prevalidate):
+        assert prevalidate({
+            "main.tf": 'locals {\n  a = <<EOT\n$${var.literal}\nEOT\n}\n'
+        }) == []
+
+    def test_heredoc_interpolation_is_checked(self, prevalidate):
+        problems = prevalidate({"main.tf": 'locals {\n  a = <<EOT\n${var.missing}\nEOT\n}\n'})
+        assert len(problems) == 1 and 'undeclared variable "missing"' in problems[0]
+
+    def test_output_for_expression_iterators(self, prevalidate):
+        assert prevalidate({
+            "main.tf": 'resource "azurerm_subnet" "this" {\n  name = "a"\n}\n',
+            "outputs.tf": (
+                'output "names" {\n  value = [for my_subnet in azurerm_subnet.this : my_subnet.name]\n}\n'
+                'output "ids" {\n  value = {for subnet_key, subnet_value in azurerm_subnet.this : '
+                'subnet_key => subnet_value.id}\n}\n'
+            )
+        }) == []
+
+    def test_output_for_expression_still_checks_its_collection(self, prevalidate):
+        problems = prevalidate({
+            "outputs.tf": 'output "names" {\n  value = [for my_item in azurerm_missing.this : my_item.name]\n}\n'
+        })
+        assert len(problems) == 1
+        assert 'references undeclared resource azurerm_missing.this' in problems[0]
+
+    def test_output_undeclared_module_and_data_source(self, prevalidate):
+        problems = prevalidate({
+            "outputs.tf": ('output "a" {\n  value = module.network.id\n}\n'
+                           'output "b" {\n  value = data.azurerm_client_config.current.tenant_id\n}\n')
+        })
+        assert any('undeclared module "network"' in p for p in problems)
+        assert any('undeclared data source data.azurerm_client_config.current' in p for p in problems)
+
+    def test_module_source_missing(self, prevalidate):
+        problems = prevalidate({"main.tf": 'module "net" {\n  source = "../networking"\n}\n'})
+        assert len(problems) == 1
+        assert problems[0].endswith('main.tf:1: module "net" source ../networking does not exist')
+
+    def test_module_source_without_tf_files(self, prevalidate, tmp_path):
+        (tmp_path / "empty").mkdir()
+        problems = prevalidate({"main.tf": 'module "net" {\n  source = "../empty"\n}\n'})
+        assert len(problems) == 1 and problems[0].endswith("source ../empty has no .tf files")
+
+    def test_module_without_source(self, prevalidate):
+        problems = prevalidate({"main.tf": 'module "net" {\n  name = "x"\n}\n'})
+        assert len(problems) == 1 and problems[0].endswith('module "net" has no source')
+
+    def test_module_registry_source_is_not_resolved(self, prevalidate):
+        assert prevalidate({
+            "main.tf": 'module "net" {\n  source = "Azure/network/azurerm"\n}\n'
+        }) == []
+
+    def test_local_module_source(self, prevalidate, tmp_path):
+        write_files(str(tmp_path / "networking"), {"main.tf": ""})
+        assert prevalidate({"main.tf": 'module "net" {\n  source = "../networking"\n}\n'}) == []
+
+    def test_syntax_errors_skip_reference_checks(self, prevalidate):
+        problems = prevalidate({"main.tf": 'locals {\n  a = var.missing\n  b = "open\n}\n'})
+        assert len(problems) == 1 and problems[0].endswith("main.tf:3: unterminated string")
+
+    def test_declarations_in_comments_do_not_count(self, prevalidate):
+        problems = prevalidate({"main.tf": '# variable "name" {\nlocals {\n  a = var.name\n}\n'})
+        assert len(problems) == 1 and 'undeclared variable "name"' in problems[0]
+
+    def test_results_are_memoized_until_reset(self, tmp_path):
+        write_files(str(tmp_path), {"main.tf": 'locals {\n  a = var.missing\n}\n'})
+        prevalidator = framework.HclPrevalidator()
+        assert len(prevalidator.check(str(tmp_path))) == 1
+        write_files(str(tmp_path), {"main.tf": 'locals {\n  a = 1\n}\n'})
+        assert len(prevalidator.check(str(tmp_path))) == 1
+        prevalidator.reset()
+        assert prevalidator.check(str(tmp_path)) == []
+
+
+def passing(name, record=None, delay=0.0):
+    def action():
+        if record is not None:
+            record.append(("start", name))
+        time.sleep(delay)
+        if record is not None:
+            record.append(("end", name))
+        return framework.TestResult(name, True, "ok", delay)
+    return action
+
+
+def failing(name):
+    return lambda: framework.TestResult(name, False, "failed", 0.0)
+
+
+class TestStageScheduler:
+    """Dependency handling of StageScheduler.run"""
+
+    def test_runs_chain_in_order(self):
+        record = []
+        scheduler = framework.StageScheduler(max_workers=4)
+        scheduler.add(framework.Stage("init", "Init", passing("Init", record)))
+        scheduler.add(framework.Stage("validate", "Validate", passing("Validate", record), ["init"]))
+        scheduler.add(framework.Stage("plan", "Plan", passing("Plan", record), ["validate"]))
+        results = scheduler.run()
+        assert list(results) == ["init", "validate", "plan"]
+        assert record == [("start", "Init"), ("end", "Init"), ("start", "Validate"),
+                          ("end", "Validate"), ("start", "Plan"), ("end", "Plan")]
+
+    def test_failed_dependency_skips_dependents(self):
+        scheduler = framework.StageScheduler(max_workers=2)
+        scheduler.add(framework.Stage("a:init", "A Init", failing("A Init")))
+        scheduler.add(framework.Stage("a:plan", "A Plan", passing("A Plan"), ["a:init"]))
+        scheduler.add(framework.Stage("a:apply", "A Apply", passing("A Apply"), ["a:plan"]))
+        scheduler.add(framework.Stage("b:init", "B Init", passing("B Init")))
+        results = scheduler.run()
+        assert list(results) == ["a:init", "b:init"]
+        assert not results["a:init"].status and results["b:init"].status
+
+    def test_results_keep_insertion_order(self):
+        scheduler = framework.StageScheduler(max_workers=2)
+        scheduler.add(framework.Stage("slow", "Slow", passing("Slow", delay=0.2)))
+        scheduler.add(framework.Stage("fast", "Fast", passing("Fast")))
+        assert list(scheduler.run()) == ["slow", "fast"]
+
+    def test_independent_stages_run_concurrently(self):
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def action():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.1)
+            with lock:
+                running[0] -= 1
+            return framework.TestResult("Stage", True, "ok", 0.1)
+
+        scheduler = framework.StageScheduler(max_workers=3)
+        for index in range(3):
+            scheduler.add(framework.Stage(f"env{index}", f"Env {index}", action))
+        scheduler.run()
+        assert peak[0] == 3
+
+    def test_exception_becomes_failed_result(self):
+        def broken():
+            raise RuntimeError("boom")
+
+        scheduler = framework.StageScheduler()
+        scheduler.add(framework.Stage("init", "Init", broken))
+        scheduler.add(framework.Stage("plan", "Plan", passing("Plan"), ["init"]))
+        results = scheduler.run()
+        assert list(results) == ["init"]
+        assert not results["init"].status and "boom" in results["init"].output
+
+    def test_rejects_unknown_and_duplicate_stages(self):
+        scheduler = framework.StageScheduler()
+        with pytest.raises(ValueError):
+            scheduler.add(framework.Stage("plan", "Plan", passing("Plan"), ["init"]))
+        scheduler.add(framework.Stage("init", "Init", passing("Init")))
+        with pytest.raises(ValueError):
+            scheduler.add(framework.Stage("init", "Init", passing("Init")))
+
+    def test_fail_fast_skips_queued_stages(self, fail_fast):
+        fail_fast.enabled = True
+        scheduler = framework.StageScheduler(max_workers=1)
+        scheduler.add(framework.Stage("a", "A Init", failing("A Init")))
+        scheduler.add(framework.Stage("b", "B Init", passing("B Init")))
+        scheduler.add(framework.Stage("c", "C Init", passing("C Init")))
+        results = scheduler.run()
+        assert fail_fast.triggered
+        assert "a" in results and "c" not in results
+
+
+class TestShardPlanner:
+    """Shard parsing and longest-processing-time assignment"""
+
+    UNITS = [("module", "compute"), ("module", "networking"), ("module", "security"),
+             ("module", "storage"), ("backend", "backend"), ("environment", "dev"),
+             ("environment", "prod"), ("environment", "staging")]
+
+    def test_parse(self):
+        assert framework.ShardPlanner.parse("2/3") == (2, 3)
+        for value in ("0/3", "4/3", "1", "a/b", "1/0"):
+            with pytest.raises(ValueError):
+                framework.ShardPlanner.parse(value)
+
+    def test_every_unit_assigned_once(self):
+        shards = framework.ShardPlanner().assign(self.UNITS, 3)
+        assigned = [unit for shard in shards for unit in shard]
+        assert sorted(assigned) == sorted(self.UNITS)
+
+    def test_assignment_is_deterministic(self):
+        planner = framework.ShardPlanner({"dev Terraform Plan": 90.0})
+        assert planner.assign(self.UNITS, 3) == planner.assign(list(reversed(self.UNITS)), 3)
+
+    def test_balances_by_history(self):
+        durations = {"compute Initialization": 100.0, "networking Initialization": 60.0,
+                     "security Initialization": 50.0, "storage Initialization": 40.0}
+        planner = framework.ShardPlanner(durations)
+        units = self.UNITS[:4]
+        shards = planner.assign(units, 2)
+        loads = sorted(sum(planner.estimate(unit) for unit in shard) for shard in shards)
+        # Longest first: 100 and 60 split, 50 joins the lighter 60, 40 the lighter 100
+        assert loads == [110.0, 140.0]
+        assert sorted(shards) == [[("module", "compute"), ("module", "storage")],
+                                  [("module", "networking"), ("module", "security")]]
+
+    def test_fallback_estimates(self):
+        planner = framework.ShardPlanner({"compute Validation": 5.0})
+        assert planner.estimate(("module", "compute")) == 5.0
+        assert planner.estimate(("module", "storage")) == planner.FALLBACK_SECONDS["module"]
+        assert planner.estimate(("environment", "dev")) == planner.FALLBACK_SECONDS["environment"]
+
+    def test_estimate_sums_a_units_tests(self):
+        planner = framework.ShardPlanner({"Backend Resource Group": 2.0, "Backend Terraform Init": 8.0,
+                                          "dev Terraform Init": 3.0, "dev Terraform Plan": 7.0})
+        assert planner.estimate(("backend", "backend")) == 10.0
+        assert planner.estimate(("environment", "dev")) == 10.0
+
+    def test_more_shards_than_units(self):
+        shards = framework.ShardPlanner().assign(self.UNITS[:2], 4)
+        assert len(shards) == 4
+        assert sum(1 for shard in shards if not shard) == 2
+
+    def test_merge_reports_missing_shard(self, tmp_path):
+        present = tmp_path / "test_report_shard1of2.json"
+        present.write_text("[]")
+        missing = tmp_path / "test_report_shard2of2.json"
+        with pytest.raises(FileNotFoundError, match="test_report_shard2of2.json"):
+            framework.JsonlReportReader.merge([str(present), str(missing)], str(tmp_path / "merged.json"))
+        assert not (tmp_path / "merged.json").exists()
+
+
+class FmtRunner:
+    """Answers the single terraform fmt pass with a canned outcome"""
+
+    def __init__(self, code, stdout="", stderr=""):
+        self.outcome = (code, stdout, stderr)
+        self.calls = 0
+
+    def run_command(self, command, env=None, timeout=None):
+        self.calls += 1
+        return self.outcome
+
+
+class TestFormatCheck:
+    UNFORMATTED = "\n".join([
+        "modules/compute/main.tf",
+        "modules/compute/examples/basic/main.tf",
+        "environments/dev/main.tf",
+        "backend-config/backend.tf",
+    ]) + "\n"
+
+    def test_module_covers_only_its_own_files(self):
+        check = framework.FormatCheck()
+        runner = FmtRunner(3, self.UNFORMATTED)
+        passed, message, _ = check.check(runner, "modules/compute")
+        assert not passed and message.endswith("files need formatting:\nmodules/compute/main.tf")
+        assert check.check(runner, "modules/storage")[0]
+        assert runner.calls == 1
+
+    def test_other_directories(self):
+        check = framework.FormatCheck()
+        assert check.other_directories() == []
+        check.check(FmtRunner(3, self.UNFORMATTED), "modules/compute")
+        assert check.other_directories() == [os.path.normpath(d) for d in (
+            "backend-config", "environments/dev", "modules/compute/examples/basic")]
+        assert not check.check(FmtRunner(0), "environments/dev")[0]
+
+    def test_parse_error_fails_the_named_directory(self):
+        check = framework.FormatCheck()
+        runner = FmtRunner(2, "", "Error: Invalid character\n\n  on environments/dev/main.tf line 3:\n")
+        assert not check.check(runner, "environments/dev")[0]
+        assert check.check(runner, "modules/compute")[0]
+        assert check.other_directories() == [os.path.normpath("environments/dev")]
+
+    def test_error_without_file_fails_everywhere(self):
+        check = framework.FormatCheck()
+        runner = FmtRunner(1, "", "Error: flag provided but not defined: -list")
+        assert not check.check(runner, "modules/compute")[0]
+        assert check.other_directories() == []
+
+    def test_pass_is_accounted_on_its_own(self):
+        class RecordingRunner(FmtRunner):
+            def run_command(self, command, env=None, timeout=None):
+                framework.ResourceUsage.record(framework.CommandOutcome(0, "", "", duration=0.2))
+                return super().run_command(command)
+
+        check = framework.FormatCheck()
+        assert check.summary() is None
+        with framework.ResourceUsage.measure() as module_usage:
+            check.check(RecordingRunner(3, self.UNFORMATTED), "modules/compute")
+        ran, message, _, usage = check.summary()
+        assert module_usage.commands == 0 and usage.commands == 1
+        assert ran and "4 file(s) need formatting" in message
+
+    def test_reset_runs_the_pass_again(self):
+        check = framework.FormatCheck()
+        runner = FmtRunner(0)
+        check.check(runner, "modules/compute")
+        check.check(runner, "modules/storage")
+        check.reset()
+        check.check(runner, "modules/compute")
+        assert runner.calls == 2
+
+
+class TestCommandPolicy:
+    @pytest.fixture
+    def policy(self, tmp_path):
+        return framework.CommandPolicy(str(tmp_path / "durations.json"))
+
+    @pytest.mark.parametrize("stderr", [
+        "ERROR: (TooManyRequests) The request is being throttled.",
+        "ERROR: (InternalServerError) Encountered internal server error. Status: 503 (Service Unavailable)",
+        "Error: storage.AccountsClient: StatusCode=502 -- Original Error: autorest/azure: Service returned an error.",
+        "ERROR: (ServerBusy) The server is currently unable to receive requests.",
+        "read tcp 10.0.0.4:51234->20.38.34.1:443: read: connection reset by peer",
+        "dial tcp: lookup login.microsoftonline.com: Temporary failure in name resolution",
+    ])
+    def test_transient_stderr(self, policy, stderr):
+        assert policy.is_transient(framework.CommandOutcome(1, "", stderr))
+
+    @pytest.mark.parametrize("stdout, stderr", [
+        ("", "Error: Failed to query available provider packages"),
+        ("", "Error: Invalid value for variable: vm_size must not be Standard_D429s"),
+        ("Plan: 429 to add, 0 to change, 503 to destroy.", "Error: exit status 1"),
+        ("ERROR: (TooManyRequests) echoed by a script", "Error: Unsupported argument"),
+    ])
+    def test_permanent_failures(self, policy, stdout, stderr):
+        assert not policy.is_transient(framework.CommandOutcome(1, stdout, stderr))
+
+    def test_success_is_never_transient(self, policy):
+        assert not policy.is_transient(framework.CommandOutcome(0, "", "Status: 429"))
+
+    def test_terraform_classes_include_the_directory(self, policy):
+        assert policy.command_class("cd environments/dev && terraform plan -no-color") == \
+            "terraform plan environments/dev"
+        assert policy.command_class("az group show --name rg") == "az group show"
+        assert policy.command_class("git rev-parse HEAD") is None
+
+    @pytest.fixture
+    def engine(self, policy, monkeypatch):
+        """Route run_command to a canned throttled outcome and record what ran"""
+        class Engine:
+            commands = []
+
+            def run(self, command, env=None, timeout=None):
+                self.commands.append((command, timeout))
+                return framework.CommandOutcome(1, "", "Status: 429", duration=0.1)
+
+        engine = Engine()
+        policy.max_attempts, policy.backoff_base = 2, 0.0
+        monkeypatch.setattr(framework.CommandRunner, "engine", engine)
+        monkeypatch.setattr(framework.CommandRunner, "policy", policy)
+        return engine
+
+    def test_uncovered_commands_bypass_the_policy(self, policy, engine):
+        framework.CommandRunner.run_command("git rev-parse HEAD")
+        assert len(engine.commands) == 1
+        assert not policy._dirty
+
+    def test_non_adaptive_commands_are_retried_but_not_recorded(self, policy, engine):
+        for _ in range(policy.MIN_SAMPLES):
+            policy.observe("cd m && terraform init", framework.CommandOutcome(0, "", "", duration=0.1))
+        outcome = framework.CommandRunner.run_command("cd m && terraform init", adaptive=False)
+        assert [timeout for _, timeout in engine.commands] == [None, None]
+        assert len(outcome.attempts) == 2
+        assert len(policy._samples["terraform init m"]) == policy.MIN_SAMPLES
+
+
+class PlanRunner:
+    """Writes the -out plan file and answers show -json through a BoundedOutput"""
+
+    def __init__(self, resources):
+        self.document = json.dumps({"resource_changes": [
+            {"address": f"azurerm_resource_group.rg{i}", "type": "azurerm_resource_group",
+             "change": {"actions": ["create"]}, "after": {"name": "x" * 200}}
+            for i in range(resources)
+        ]}).encode()
+        self.commands = []
+
+    def run_command(self, command, env=None, timeout=None):
+        self.commands.append(command)
+        if " plan " in command:
+            with open(command.split("-out=")[1], "w") as f:
+                f.write("plan")
+            return framework.CommandOutcome(0, "planned", "")
+        output = framework.BoundedOutput("terraform show")
+        output.feed(self.document)
+        return framework.CommandOutcome(0, output.close(), "")
+
+
+class TestPlanCapture:
+    @pytest.fixture
+    def plans(self, tmp_path):
+        (tmp_path / "env").mkdir()
+        (tmp_path / "env" / "main.tf").write_text('locals {}\n')
+        return framework.PlanCapture(str(tmp_path / "plans"))
+
+    def test_summarizes_plan_larger_than_the_output_bound(self, plans, tmp_path, spill_dir):
+        runner = PlanRunner(400)
+        assert len(runner.document) > framework.BoundedOutput.HEAD_BYTES + framework.BoundedOutput.TAIL_BYTES
+        outcome = plans.plan(runner, str(tmp_path / "env"), "-no-color")
+        assert outcome.summary["by_action"] == {"create": 400}
+        assert any(spill_dir.iterdir())
+
+    def test_reuses_summary_with_unchanged_inputs(self, plans, tmp_path, spill_dir):
+        plans.plan(PlanRunner(3), str(tmp_path / "env"), "-no-color")
+        plans.reuse = True
+        runner = PlanRunner(3)
+        outcome = plans.plan(runner, str(tmp_path / "env"), "-no-color")
+        assert outcome.reused and outcome.summary["changes"] == 3
+        assert runner.commands == []
+
+    def test_plan_files_are_private(self, plans, tmp_path, spill_dir):
+        outcome = plans.plan(PlanRunner(1), str(tmp_path / "env"), "-no-color")
+        assert os.stat(plans.directory).st_mode & 0o777 == 0o700
+        assert os.stat(outcome.summary["plan_file"]).st_mode & 0o777 == 0o600
+
+    def test_prunes_plans_across_directories(self, plans, tmp_path, spill_dir):
+        plans.max_plans = 2
+        for index in range(4):
+            env = tmp_path / f"env{index}"
+            env.mkdir()
+            (env / "main.tf").write_text('locals {}\n')
+            plans.plan(PlanRunner(1), str(env), "-no-color")
+        assert len([name for name in os.listdir(plans.directory) if name.endswith(".tfplan")]) == 2
+        with open(os.path.join(plans.directory, "index.json")) as f:
+            assert sorted(json.load(f)) == [str(tmp_path / "env2"), str(tmp_path / "env3")]
+
+
+class TestStageRegistry:
+    @pytest.fixture
+    def registry(self):
+        registry = framework.StageRegistry()
+        calls = []
+
+        @registry.register("init", "Init")
+        def init(runner, spec):
+            calls.append(("init", spec.init_flags))
+            return framework.TestResult("Init", True, "ok", 0.0)
+
+        @registry.register("validate", "Validate", depends_on=["init"])
+        def validate(runner, spec):
+            calls.append(("validate", spec.init_flags))
+            framework.ResourceUsage.record(framework.CommandOutcome(0, "", "", duration=0.5))
+            framework.ResourceUsage.record_attempts([{"attempt": 1}])
+            return framework.TestResult("Validate", True, "ok", 0.0)
+
+        registry.calls = calls
+        return registry
+
+    def spec(self, key, init_flags, path):
+        return framework.EnvironmentSpec(key, key.title(), str(path), ["init", "validate"], init_flags=init_flags)
+
+    def test_reuses_results_for_the_same_directory(self, registry, tmp_path):
+        first = registry.run_all(None, self.spec("dev", "-backend=false", tmp_path))
+        second = registry.run_all(None, self.spec("dev", "-backend=false -no-color", tmp_path))
+        assert len(registry.calls) == 2
+        assert all(result.reused for result in second)
+        assert second[1].attempts == first[1].attempts == [{"attempt": 1}]
+        assert second[1].resources == first[1].resources
+
+    def test_init_mode_is_part_of_dependent_keys(self, registry, tmp_path):
+        registry.run_all(None, self.spec("dev", "-backend=false", tmp_path))
+        registry.run_all(None, self.spec("prod", "-backend-config=prod.hcl", tmp_path))
+        assert registry.calls == [("init", "-backend=false"), ("validate", "-backend=false"),
+                                  ("init", "-backend-config=prod.hcl"), ("validate", "-backend-config=prod.hcl")]
+
+    def test_timing_comes_from_the_span(self, registry, tmp_path):
+        result = registry.run_all(None, self.spec("dev", "-backend=false", tmp_path))[0]
+        assert result.finished - result.started == pytest.approx(result.duration)
+
+
+class TestFailureHistory:
+    def test_shard_reports_are_not_counted_twice(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        failed = json.dumps([{"name": "compute Validation", "status": "FAIL"}])
+        passed = json.dumps([{"name": "compute Validation", "status": "PASS"}])
+        (tmp_path / "test_report_shard1of2.json").write_text(failed)
+        (tmp_path / "test_report_20250101_000000.json").write_text(failed)
+        (tmp_path / "test_report_20250102_000000.json").write_text(passed)
+        history = framework.FailureHistory.from_reports()
+        assert history.rates == {"compute Validation": 0.5}
+        assert history.order(["storage", "compute"]) == ["compute", "storage"]
+
+
+LOCK_FILE = '''provider "registry.terraform.io/hashicorp/azurerm" {
+  version = "3.0.0"
+  hashes = [
+    "h1:abc=",
+  ]
+}
+'''
+
+
+class TestProviderCache:
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return framework.ProviderCache(root=str(tmp_path / "cache"), max_bytes=1 << 30)
+
+    @pytest.fixture
+    def directory(self, tmp_path):
+        write_files(str(tmp_path / "module"), {".terraform.lock.hcl": LOCK_FILE})
+        return str(tmp_path / "module")
+
+    def test_waiter_skips_the_key_lock_once_the_entry_is_warm(self, cache, directory):
+        key = cache.cache_key(directory)
+        held = []
+
+        def waiter():
+            with cache.lease(directory):
+                held.append(cache._key_locks[key].locked())
+
+        with cache.lease(directory) as cache_dir:
+            assert cache._key_locks[key].locked()
+            thread = threading.Thread(target=waiter)
+            thread.start()
+            time.sleep(0.1)  # The waiter saw a cold entry and queued on the key lock
+            cache.mark_ready(cache_dir)
+        thread.join()
+        assert held == [False]
+
+    def test_cold_entries_stay_locked_until_ready(self, cache, directory):
+        with cache.lease(directory):
+            pass
+        with cache.lease(directory):
+            assert cache._key_locks[cache.cache_key(directory)].locked()
+
+    def test_eviction_is_throttled(self, cache, directory, monkeypatch):
+        calls = []
+        monkeypatch.setattr(cache, "evict", lambda: calls.append(1))
+        for _ in range(3):
+            with cache.lease(directory):
+                pass
+        assert len(calls) == 1
+
+
+class TestTracer:
+    def test_traced_keeps_the_function_metadata(self):
+        tracer = framework.Tracer()
+
+        @tracer.traced("phase")
+        def summarize(value):
+            """Summarize a value"""
+            return value * 2
+
+        assert summarize(2) == 4
+        assert summarize.__name__ == "summarize" and summarize.__doc__ == "Summarize a value"
+        assert summarize.__wrapped__(3) == 6
+        assert [span.name for span in tracer._spans] == ["summarize"]
+
+    def test_chrome_trace_event_shape(self, tmp_path):
+        tracer = framework.Tracer()
+        with tracer.span("environment dev", "environment"):
+            with tracer.span("dev Terraform Plan", "phase", attempt=1):
+                time.sleep(0.01)
+        path = tmp_path / "trace.json"
+        tracer.export_chrome_trace(str(path))
+        trace = json.loads(path.read_text())
+
+        assert trace["displayTimeUnit"] == "ms"
+        metadata = [e for e in trace["traceEvents"] if e["ph"] == "M"]
+        assert metadata == [{"name": "thread_name", "ph": "M", "pid": os.getpid(),
+                             "tid": threading.get_ident(), "args": {"name": threading.current_thread().name}}]
+        outer, inner = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+        assert (outer["name"], outer["cat"]) == ("environment dev", "environment")
+        assert (inner["name"], inner["cat"], inner["args"]) == ("dev Terraform Plan", "phase", {"attempt": 1})
+        assert inner["dur"] >= 10000  # Microseconds
+        assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+        assert outer["tid"] == inner["tid"] == threading.get_ident()
+
+
+class TestIncrementalCache:
+    @pytest.fixture
+    def tree(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        write_files(str(tmp_path), {
+            "environments/dev/main.tf": 'module "net" {\n  source = "../../modules/networking"\n}\n',
+            "environments/dev/README.md": "notes\n",
+            "modules/networking/main.tf": 'locals {}\n',
+        })
+        return tmp_path
+
+    def fingerprint(self, var_inputs=None):
+        return framework.Fingerprinter().fingerprint("environments/dev", var_inputs)
+
+    @pytest.mark.parametrize("name, content", [
+        ("environments/dev/main.tf", 'module "net" {\n  source = "../../modules/networking"\n}\n# edit\n'),
+        ("environments/dev/dev.tfvars", 'location = "westeurope"\n'),
+        ("environments/dev/.terraform.lock.hcl", LOCK_FILE),
+        ("modules/networking/variables.tf", 'variable "cidr" {}\n'),
+    ])
+    def test_input_changes_change_the_fingerprint(self, tree, name, content):
+        before = self.fingerprint()
+        write_files(str(tree), {name: content})
+        assert self.fingerprint() != before
+
+    def test_unrelated_files_and_plan_vars(self, tree):
+        before = self.fingerprint()
+        write_files(str(tree), {"environments/dev/README.md": "changed\n", "modules/compute/main.tf": "locals {}\n"})
+        assert self.fingerprint() == before
+        assert self.fingerprint(["environment=dev"]) != self.fingerprint(["environment=prod"])
+
+    def test_cached_results_follow_the_fingerprint(self, tree):
+        cache = framework.ResultCache(str(tree / "results.json"))
+        fingerprint = self.fingerprint()
+        cache.store("environments/dev", fingerprint, [framework.TestResult("Dev Plan", True, "ok", 1.5)])
+
+        reloaded = framework.ResultCache(str(tree / "results.json"))
+        results = reloaded.lookup("environments/dev", fingerprint)
+        assert [(r.name, r.status, r.duration, r.reused) for r in results] == [("Dev Plan", True, 1.5, True)]
+        write_files(str(tree), {"modules/networking/main.tf": 'locals {\n  a = 1\n}\n'})
+        assert reloaded.lookup("environments/dev", self.fingerprint()) is None
+
+    def test_failed_runs_are_forgotten(self, tree):
+        cache = framework.ResultCache(str(tree / "results.json"))
+        fingerprint = self.fingerprint()
+        cache.store("environments/dev", fingerprint, [framework.TestResult("Dev Plan", True, "ok", 1.0)])
+        cache.store("environments/dev", fingerprint, [framework.TestResult("Dev Plan", False, "failed", 1.0)])
+        assert cache.lookup("environments/dev", fingerprint) is None
+
+
+class AzRunner:
+    """Counts az calls and answers them with a canned outcome"""
+
+    def __init__(self, code=0, stdout='{"name": "tfstate"}', stderr="", delay=0.0):
+        self.outcome = (code, stdout, stderr)
+        self.delay = delay
+        self.commands = []
+
+    def run_command(self, command, env=None, timeout=None):
+        self.commands.append(command)
+        time.sleep(self.delay)
+        return self.outcome
+
+
+class TestStorageAccountSnapshot:
+    def test_checks_share_one_fetch(self):
+        runner = AzRunner(delay=0.05)
+        snapshot = framework.StorageAccountSnapshot(runner, "tfstate", "rg")
+        documents = []
+        threads = [threading.Thread(target=lambda: documents.append(snapshot.get())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert documents == [({"name": "tfstate"}, "")] * 4
+        assert runner.commands == ["az storage account show --name tfstate --resource-group rg"]
+
+    def test_refresh_fetches_again(self):
+        runner = AzRunner()
+        snapshot = framework.StorageAccountSnapshot(runner, "tfstate", "rg")
+        snapshot.get()
+        snapshot.refresh()
+        snapshot.get()
+        assert len(runner.commands) == 2
+
+    def test_errors_are_memoized_too(self):
+        runner = AzRunner(code=1, stdout="", stderr="ResourceNotFound")
+        snapshot = framework.StorageAccountSnapshot(runner, "tfstate", "rg")
+        assert snapshot.get() == (None, "ResourceNotFound")
+        assert snapshot.get() == (None, "ResourceNotFound")
+        assert len(runner.commands) == 1
+
+    def test_unparsable_document(self):
+        snapshot = framework.StorageAccountSnapshot(AzRunner(stdout="not json"), "tfstate", "rg")
+        document, error = snapshot.get()
+        assert document is None and error.startswith("Failed to parse storage account info")
+
+
+def process_alive(pid, wait=2.0):
+    """Whether pid is still a running (not zombie) process after up to wait seconds"""
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                running = f.read().rsplit(")", 1)[1].split()[0] != "Z"
+        except FileNotFoundError:
+            running = False
+        if not running or time.monotonic() > deadline:
+            return running
+        time.sleep(0.05)
+
+
+class TestAsyncCommandEngine:
+    @pytest.fixture
+    def engine(self):
+        engine = framework.AsyncCommandEngine(max_concurrency=4)
+        yield engine
+        engine.cancel_all()
+
+    def test_exit_code_and_streams(self, engine):
+        outcome = engine.run("printf out; printf err >&2; exit 3")
+        assert (outcome.code, outcome.stdout, outcome.stderr) == (3, "out", "err")
+        assert not outcome.timed_out
+
+    def test_timeout_returns_124(self, engine):
+        start = time.monotonic()
+        outcome = engine.run("sleep 30", timeout=0.2)
+        assert outcome.code == framework.AsyncCommandEngine.TIMEOUT_EXIT_CODE == 124
+        assert outcome.timed_out and "timed out after 0.2s" in outcome.stderr
+        assert time.monotonic() - start < 5
+
+    def test_timeout_kills_the_whole_process_group(self, engine, tmp_path):
+        pid_file = tmp_path / "child.pid"
+        outcome = engine.run(f"sleep 30 & echo $! > {pid_file}; wait", timeout=0.3)
+        assert outcome.timed_out
+        assert not process_alive(int(pid_file.read_text()))
+
+    def test_sigterm_is_escalated_to_sigkill(self, engine, tmp_path, monkeypatch):
+        monkeypatch.setattr(engine, "KILL_GRACE_PERIOD", 0.2)
+        pid_file = tmp_path / "child.pid"
+        outcome = engine.run(f"trap '' TERM; sleep 30 & echo $! > {pid_file}; wait", timeout=0.3)
+        assert outcome.timed_out
+        assert not process_alive(int(pid_file.read_text()))
+
+    def test_cancel_all_stops_running_commands(self, engine):
+        outcomes = []
+        thread = threading.Thread(target=lambda: outcomes.append(engine.run("sleep 30")))
+        thread.start()
+        time.sleep(0.2)
+        engine.cancel_all()
+        thread.join(5)
+        assert outcomes[0].cancelled and outcomes[0].code == framework.AsyncCommandEngine.CANCELLED_EXIT_CODE
+
+    def test_run_many_keeps_input_order(self, engine):
+        outcomes = engine.run_many(["sleep 0.2; echo slow", "echo fast"])
+        assert [outcome.stdout.strip() for outcome in outcomes] == ["slow", "fast"]
+
+    def test_interrupted_engine_refuses_new_commands(self, engine):
+        engine.interrupt()
+        assert engine.run("echo never").cancelled
+
+
+class TestBoundedOutput:
+    def test_small_output_stays_in_memory(self, spill_dir):
+        output = framework.BoundedOutput("echo", head_bytes=8, tail_bytes=8)
+        output.feed(b"hello ")
+        output.feed(b"world")
+        captured = output.close()
+        assert captured == "hello world"
+        assert captured.spill_path is None and captured.total_bytes == 11
+        assert not spill_dir.exists()
+
+    def test_large_output_keeps_head_and_tail_and_spills_everything(self, spill_dir):
+        output = framework.BoundedOutput("terraform plan", head_bytes=10, tail_bytes=10)
+        data = bytes(range(48, 58)) * 10  # 100 bytes of digits
+        for start in range(0, len(data), 7):
+            output.feed(data[start:start + 7])
+        captured = output.close()
+        assert captured.startswith("0123456789") and captured.endswith("0123456789")
+        assert f"[80 bytes omitted, full output in {captured.spill_path}]" in captured
+        assert captured.total_bytes == 100
+        with open(captured.spill_path, "rb") as f:
+            assert f.read() == data
+        assert os.path.dirname(captured.spill_path) == str(spill_dir)
+
+    def test_prune_removes_oldest_spill_files(self, spill_dir):
+        spill_dir.mkdir()
+        for index in range(3):
+            path = spill_dir / f"{index}.log"
+            path.write_bytes(b"x" * 100)
+            os.utime(path, (1000 + index, 1000 + index))
+        framework.BoundedOutput.prune(max_bytes=150)
+        assert sorted(os.listdir(spill_dir)) == ["2.log"]
+
+    def test_results_keep_both_spill_files(self, spill_dir):
+        streams = []
+        for label in ("stdout", "stderr"):
+            output = framework.BoundedOutput(label, head_bytes=4, tail_bytes=4)
+            output.feed(b"x" * 20)
+            streams.append(output.close())
+        result = framework.TestResult("Plan", False, f"Plan failed: {streams[1]}", 1.0, streams=tuple(streams))
+        assert (result.output_file, result.error_file) == (streams[0].spill_path, streams[1].spill_path)
+        restored = framework.TestResult.from_dict(result.to_dict())
+        assert (restored.output_file, restored.error_file) == (result.output_file, result.error_file)
+
+
+class TestResultStore:
+    @pytest.fixture
+    def store(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        store = framework.ResultStore(str(tmp_path / "history.sqlite3"))
+        yield store
+        store.close()
+
+    def record_runs(self, store, runs):
+        """Record one run per entry of (status, duration) pairs for test 'A'"""
+        for status, duration, *reused in runs:
+            run_id = store.begin_run("modules")
+            result = framework.TestResult("A", status, "", duration)
+            result.reused = bool(reused)
+            store.record(run_id, result)
+            time.sleep(0.002)  # Distinct started_at ordering
+
+    def test_percentile_interpolates(self):
+        percentile = framework.ResultStore.percentile
+        assert percentile([4, 1, 3, 2], 50) == 2.5
+        assert percentile([1, 2, 3, 4], 95) == pytest.approx(3.85)
+        assert percentile([7], 95) == 7 and percentile([], 50) == 0.0
+
+    def test_duration_percentiles_cover_the_last_runs(self, store):
+        self.record_runs(store, [(True, 100.0), (True, 2.0), (True, 4.0)])
+        assert store.duration_percentiles(last_runs=2) == {"A": {"count": 2, "p50": 3.0, "p95": 3.9}}
+
+    def test_flakiness_counts_flips(self, store):
+        self.record_runs(store, [(True, 1.0), (False, 1.0), (True, 1.0), (True, 1.0)])
+        assert store.flakiness() == {"A": {"runs": 4, "failure_rate": 0.25, "flakiness": 2 / 3}}
+
+    def test_reused_results_are_left_out(self, store):
+        self.record_runs(store, [(True, 5.0), (False, 0.0, "reused")])
+        assert store.flakiness()["A"]["runs"] == 1
+        assert store.duration_percentiles()["A"]["p50"] == 5.0
+
+
+class TestJsonlReports:
+    def write_report(self, path, results):
+        writer = framework.JsonlReportWriter(str(path))
+        for result in results:
+            writer(result)
+        writer.close()
+        return writer
+
+    def test_round_trip(self, tmp_path):
+        result = framework.TestResult("dev Terraform Plan", False, "Plan failed: ünïcode", 2.5)
+        result.plan = {"changes": 1}
+        writer = self.write_report(tmp_path / "report.jsonl", [result, framework.TestResult("B", True, "ok", 0.1)])
+        assert writer.count == 2
+        rows = list(framework.JsonlReportReader.read(str(tmp_path / "report.jsonl")))
+        assert rows[0] == result.to_dict()
+        restored = framework.TestResult.from_dict(rows[0])
+        assert (restored.name, restored.status, restored.output, restored.duration) == \
+            ("dev Terraform Plan", False, "Plan failed: ünïcode", 2.5)
+
+    def test_each_result_is_flushed_as_it_is_written(self, tmp_path):
+        writer = framework.JsonlReportWriter(str(tmp_path / "report.jsonl"))
+        writer(framework.TestResult("A", True, "ok", 0.1))
+        assert [row["name"] for row in framework.JsonlReportReader.read(str(tmp_path / "report.jsonl"))] == ["A"]
+        writer.close()
+        writer(framework.TestResult("B", True, "ok", 0.1))  # Ignored once closed
+        assert writer.count == 1
+
+    def test_torn_last_line_is_skipped(self, tmp_path):
+        path = tmp_path / "report.jsonl"
+        self.write_report(path, [framework.TestResult("A", True, "ok", 0.1)])
+        with open(path, "a") as f:
+            f.write('{"name": "B", "sta')
+        assert [row["name"] for row in framework.JsonlReportReader.read(str(path))] == ["A"]
+        assert [row["name"] for row in framework.JsonlReportReader.tail(str(path))] == ["A"]
+
+    def test_merge_orders_by_timestamp(self, tmp_path):
+        early, late = framework.TestResult("early", True, "", 0.0), framework.TestResult("late", True, "", 0.0)
+        early.timestamp = datetime.datetime(2025, 1, 1)
+        late.timestamp = datetime.datetime(2025, 1, 2)
+        self.write_report(tmp_path / "a.jsonl", [late])
+        self.write_report(tmp_path / "b.jsonl", [early])
+        merged = tmp_path / "merged.json"
+        assert framework.JsonlReportReader.merge([str(tmp_path / "a.jsonl"), str(tmp_path / "b.jsonl")],
+                                                 str(merged)) == 2
+        assert [row["name"] for row in json.loads(merged.read_text())] == ["early", "late"]
+
+
+class TestResultOutput:
+    @pytest.mark.parametrize("raw, text", [
+        (b"\x1b[31mError:\x1b[0m bad", "Error: bad"),
+        (b"\x1b[1;32m+\x1b[0m create", "+ create"),
+        (b"\x1b]8;;https://example.com\x07link\x1b]8;;\x07 text", "link text"),
+        (b"\x1b]8;;https://example.com\x1b\\link\x1b]8;;\x1b\\", "link"),
+        (b"\x1b(B\x1b[mplain", "plain"),
+        (b"no escapes", "no escapes"),
+    ])
+    def test_ansi_sequences_are_stripped(self, raw, text):
+        assert framework.TestResult("A", True, raw, 0.0).output == text
+
+    def test_captured_bytes_are_kept_unchanged(self):
+        captured = framework.CapturedOutput("�", raw=b"\xff")
+        result = framework.TestResult("A", True, captured, 0.0)
+        assert result.raw_output == b"\xff" and result.output == "�"
+
+    def test_text_is_stored_as_utf8(self):
+        result = framework.TestResult("A", False, "Plan failed: ünïcode", 0.0)
+        assert result.raw_output == "Plan failed: ünïcode".encode()
+
+    def test_slots_keep_results_compact(self):
+        result = framework.TestResult("A", True, "ok", 0.0)
+        with pytest.raises(AttributeError):
+            result.extra = 1
+        assert not hasattr(result, "__dict__")
+
+
+EXTRACTOR_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "backend-config", "scripts", "azure_user_account_Info_extractor.py")
+
+ACCOUNT = {"id": "sub-1", "name": "Dev", "tenantId": "tenant-1", "user": {"name": "dev@example.com"}}
+STORAGE_ACCOUNTS = [
+    {"name": "tfstatel9wa1akm", "resourceGroup": "terraform-state-rg", "location": "westeurope",
+     "tags": {"Purpose": "terraform-state"}},
+    {"name": "appdata01", "resourceGroup": "App-RG", "location": "westeurope", "tags": {"env": "dev"}},
+    {"name": "statestore", "resourceGroup": "ops-rg", "location": "westeurope", "tags": {"Purpose": "terraform-state"}},
+]
+
+
+@pytest.fixture
+def extractor(tmp_path, monkeypatch):
+    """A fresh copy of the account info extractor answering az calls from canned documents"""
+    spec = importlib.util.spec_from_file_location("account_info_extractor", EXTRACTOR_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "ACCOUNT_CACHE_PATH", str(tmp_path / "cache" / "account.json"))
+    monkeypatch.setattr(module, "ACCOUNT_CACHE_TTL", 3600)
+    monkeypatch.setenv("AZURE_CONFIG_DIR", str(tmp_path / "azure"))
+    write_files(str(tmp_path / "azure"), {"azureProfile.json": '{"subscriptions": ["sub-1"]}'})
+
+    module.az_calls = []
+    responses = {"az account show": ACCOUNT, "az storage account list": STORAGE_ACCOUNTS}
+
+    def run_az_command(command):
+        module.az_calls.append(command)
+        return next(json.dumps(document) for prefix, document in responses.items() if command.startswith(prefix))
+
+    monkeypatch.setattr(module, "run_az_command", run_az_command)
+    return module
+
+
+class TestExtractorAccountCache:
+    def test_one_az_call_serves_every_field(self, extractor):
+        assert (extractor.get_subscription_id(), extractor.get_tenant_id(), extractor.get_signed_in_user()) == \
+            ("sub-1", "tenant-1", "dev@example.com")
+        assert extractor.az_calls == ["az account show -o json"]
+
+    def test_disk_cache_is_private_and_survives_a_restart(self, extractor):
+        extractor.get_account_info()
+        assert os.stat(extractor.ACCOUNT_CACHE_PATH).st_mode & 0o777 == 0o600
+        extractor._account_info = None
+        assert extractor.get_tenant_id() == "tenant-1"
+        assert len(extractor.az_calls) == 1
+
+    def test_new_login_invalidates_the_cache(self, extractor, tmp_path):
+        extractor.get_account_info()
+        extractor._account_info = None
+        write_files(str(tmp_path / "azure"), {"azureProfile.json": '{"subscriptions": ["sub-2"]}'})
+        extractor.get_account_info()
+        assert len(extractor.az_calls) == 2
+
+    def test_expired_cache_and_refresh_fetch_again(self, extractor, monkeypatch):
+        extractor.get_account_info()
+        extractor.get_account_info(refresh=True)
+        monkeypatch.setattr(extractor, "ACCOUNT_CACHE_TTL", 0)
+        extractor._account_info = None
+        extractor.get_account_info()
+        assert len(extractor.az_calls) == 3
+
+
+class TestExtractorStorageIndex:
+    def test_lookups_share_one_listing(self, extractor):
+        assert [a["name"] for a in extractor.find_storage_accounts(resource_group="app-rg")] == ["appdata01"]
+        assert [a["name"] for a in extractor.find_storage_accounts(prefix="tfstate")] == ["tfstatel9wa1akm"]
+        assert [a["name"] for a in extractor.find_storage_accounts(tags={"purpose": None})] == \
+            ["tfstatel9wa1akm", "statestore"]
+        assert extractor.get_storage_accounts("missing-rg") == []
+        assert [c for c in extractor.az_calls if "storage" in c] == [extractor.az_calls[0]]
+
+    def test_filters_combine(self, extractor):
+        assert extractor.find_storage_accounts(resource_group="ops-rg", tags={"Purpose": "terraform-state"}) == \
+            [STORAGE_ACCOUNTS[2]]
+        assert extractor.find_storage_accounts(resource_group="ops-rg", prefix="tfstate") == []
+
+    def test_state_accounts_by_prefix_or_tag(self, extractor):
+        assert [a["name"] for a in extractor.find_state_storage_accounts()] == ["statestore", "tfstatel9wa1akm"]
+
+
+class TestExtractorBatch:
+    @pytest.fixture
+    def environments(self, tmp_path):
+        for name in ("dev", "prod"):
+            (tmp_path / "environments" / name).mkdir(parents=True)
+        return str(tmp_path / "environments")
+
+    def test_writes_every_environment_without_prompts(self, extractor, environments, capsys):
+        assert extractor.generate_backend_configs(environments, storage_account="tfstatel9wa1akm")
+        with open(os.path.join(environments, "prod", "backend.hcl")) as f:
+            assert f.read() == (
+                'resource_group_name  = "terraform-state-rg"\n'
+                'storage_account_name = "tfstatel9wa1akm"\n'
+                'container_name       = "tfstate"\n'
+                'key                  = "prod.terraform.tfstate"\n'
+                'subscription_id      = "sub-1"\n')
+        assert extractor.generate_backend_configs(environments, storage_account="tfstatel9wa1akm")
+        assert capsys.readouterr().out.count("up to date") == 2
+
+    def test_tf_format_renders_a_backend_block(self, extractor):
+        assert extractor.render_backend_config({"key": "dev.terraform.tfstate"}, "tf") == (
+            'terraform {\n  backend "azurerm" {\n    key = "dev.terraform.tfstate"\n  }\n}\n')
+
+    def test_dry_run_writes_nothing(self, extractor, environments, capsys):
+        assert extractor.generate_backend_configs(environments, storage_account="statestore", fmt="tf", dry_run=True)
+        assert not os.path.exists(os.path.join(environments, "dev", "backend.tf"))
+        assert 'storage_account_name = "statestore"' in capsys.readouterr().out
+
+    def test_ambiguous_or_unknown_accounts_are_refused(self, extractor, environments, capsys):
+        assert not extractor.generate_backend_configs(environments)
+        assert "found: statestore, tfstatel9wa1akm" in capsys.readouterr().out
+        assert not extractor.generate_backend_configs(environments, storage_account="nope")
+        assert not os.path.exists(os.path.join(environments, "dev", "backend.hcl"))
+
+
+class TestWorkspacePool:
+    @pytest.fixture
+    def pool(self, tmp_path):
+        cache = framework.ProviderCache(root=str(tmp_path / "cache"), max_bytes=1 << 30)
+        return framework.WorkspacePool(cache, root=str(tmp_path / "workspaces"), max_entries=2)
+
+    def module(self, tmp_path, name, files=None):
+        write_files(str(tmp_path / name), {".terraform.lock.hcl": LOCK_FILE, **(files or {})})
+        return str(tmp_path / name)
+
+    def test_ready_workspaces_are_reused_warm(self, pool, tmp_path):
+        directory = self.module(tmp_path, "a")
+        with pool.lease(directory) as (data_dir, warm):
+            assert not warm
+            pool.mark_ready(data_dir, directory)
+        with pool.lease(directory) as (reused, warm):
+            assert (reused, warm) == (data_dir, True)
+
+    def test_dangling_provider_links_make_a_workspace_cold(self, pool, tmp_path):
+        directory = self.module(tmp_path, "a")
+        with pool.lease(directory) as (data_dir, _):
+            os.symlink(str(tmp_path / "evicted"), os.path.join(data_dir, "provider"))
+            pool.mark_ready(data_dir, directory)
+        with pool.lease(directory) as (_, warm):
+            assert not warm
+
+    def test_keys_follow_lock_files_and_module_calls(self, pool, tmp_path):
+        plain = [self.module(tmp_path, name) for name in ("a", "b")]
+        calls = [self.module(tmp_path, name, {"main.tf": 'module "x" {\n  source = "../a"\n}\n'})
+                 for name in ("c", "d")]
+        write_files(str(tmp_path / "unlocked"), {"main.tf": ""})
+        assert pool.workspace_key(str(tmp_path / "unlocked")) is None
+        assert pool.workspace_key(plain[0]) == pool.workspace_key(plain[1])
+        assert len({pool.workspace_key(d) for d in plain + calls}) == 3
+
+    def test_least_recently_used_workspaces_are_evicted(self, pool, tmp_path):
+        directories = [self.module(tmp_path, name, {"main.tf": 'module "x" {}\n'}) for name in "abc"]
+        for directory in directories:
+            with pool.lease(directory):
+                time.sleep(0.01)
+        assert sorted(os.listdir(pool.root)) == sorted(
+            os.path.basename(pool.data_dir(d)) for d in directories[1:])
+
+
+class TestFailFast:
+    def test_first_gating_failure_triggers(self, fail_fast):
+        fail_fast.enabled = True
+        fail_fast.observe([framework.TestResult("compute Format Check", False, "", 0.0)])
+        assert not fail_fast.triggered
+        first = framework.TestResult("compute Validation", False, "", 0.0)
+        fail_fast.observe([framework.TestResult("storage Validation", True, "", 0.0), first])
+        fail_fast.observe([framework.TestResult("network Validation", False, "", 0.0)])
+        assert fail_fast.triggered and fail_fast.failed is first
+
+    def test_disabled_runs_never_trigger(self, fail_fast):
+        fail_fast.observe([framework.TestResult("compute Validation", False, "", 0.0)])
+        assert not fail_fast.triggered
+
+    def test_failures_caused_by_cancellation_are_dropped(self, fail_fast):
+        fail_fast.enabled = True
+        before = framework.TestResult("storage Validation", False, "", 0.0)
+        passed = framework.TestResult("network Validation", True, "", 0.0)
+        first = framework.TestResult("compute Validation", False, "", 0.0)
+        fail_fast.observe([first])
+        cancelled = framework.TestResult("dns Validation", False, "", 0.0)
+        assert fail_fast.keep([before, passed, first, cancelled]) == [before, passed, first]
+
+    def test_commands_are_cancelled_once_triggered(self, fail_fast):
+        fail_fast.trigger(framework.TestResult("compute Validation", False, "", 0.0))
+        outcome = framework.CommandRunner.run_command("echo never")
+        assert outcome.cancelled and outcome.code == framework.AsyncCommandEngine.CANCELLED_EXIT_CODE
+
+    def test_reset_re_arms(self, fail_fast):
+        fail_fast.enabled = True
+        fail_fast.observe([framework.TestResult("compute Validation", False, "", 0.0)])
+        fail_fast.reset()
+        assert not fail_fast.triggered and fail_fast.failed is None
+        assert framework.CommandRunner.run_command("echo again")[:2] == (0, "again\n")
+
+    def test_likely_failures_run_first(self):
+        history = framework.FailureHistory({"dns Validation": 0.1, "compute Plan": 0.6})
+        assert history.order(["storage", "dns", "compute"]) == ["compute", "dns", "storage"]
+
+
+class TestResourceUsage:
+    def test_nested_blocks_account_the_same_command(self):
+        with framework.ResourceUsage.measure() as outer:
+            framework.CommandRunner.run_command("true")
+            with framework.ResourceUsage.measure() as inner:
+                framework.CommandRunner.run_command("true")
+        framework.CommandRunner.run_command("true")
+        assert (outer.commands, inner.commands) == (2, 1)
+        assert outer.to_dict()["max_rss_kb"] > 0 and outer.wall >= inner.wall > 0
+
+    def test_separate_blocks_hide_from_enclosing_ones(self):
+        with framework.ResourceUsage.measure() as outer:
+            with framework.ResourceUsage.measure(separate=True) as shared:
+                framework.CommandRunner.run_command("true")
+            framework.CommandRunner.run_command("true")
+        assert (outer.commands, shared.commands) == (1, 1)
+
+    def test_retry_attempts_reach_the_result(self, tmp_path, monkeypatch):
+        outcomes = iter([framework.CommandOutcome(1, "", "Status: 429", duration=0.1),
+                         framework.CommandOutcome(0, "ok", "", duration=0.1)])
+
+        class Engine:
+            def run(self, command, env=None, timeout=None):
+                return next(outcomes)
+
+        policy = framework.CommandPolicy(str(tmp_path / "durations.json"))
+        policy.backoff_base = 0.0
+        monkeypatch.setattr(framework.CommandRunner, "engine", Engine())
+        monkeypatch.setattr(framework.CommandRunner, "policy", policy)
+        with framework.ResourceUsage.measure() as usage:
+            framework.CommandRunner.run_command("az group show --name rg")
+        result = framework.TestResult("rg Check", True, "ok", 0.2)
+        result.record_usage(usage)
+        data = result.to_dict()
+        assert data["resources"]["commands"] == 2
+        assert [a["attempt"] for a in data["attempts"]] == [1, 2]
+
+    def test_results_without_commands_carry_no_usage(self):
+        result = framework.TestResult("Backend Config", True, "", 0.0)
+        with framework.ResourceUsage.measure() as usage:
+            pass
+        result.record_usage(usage)
+        assert "resources" not in result.to_dict() and "attempts" not in result.to_dict()